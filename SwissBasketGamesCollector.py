@@ -1,15 +1,21 @@
-import requests
+import aiohttp
+import asyncio
+import hashlib
 import pandas as pd
 import json
+import orjson
 import io
 import os
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import logging
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 
 # Create logs directory
 logs_dir = Path(os.path.dirname(os.path.abspath(__file__))) / "logs"
@@ -30,6 +36,9 @@ class Settings:
     def __init__(self, settings_path='settings.json'):
         self.settings_path = settings_path
         self._data = self.load_settings()
+        # Set by callers after mutating settings; checked once at the end
+        # of the run so the file is written at most once
+        self.dirty = False
 
     def load_settings(self):
         """Load settings from settings.json file."""
@@ -41,10 +50,13 @@ class Settings:
             raise
 
     def save_settings(self):
-        """Save settings to settings.json file."""
+        """Save settings to settings.json file, atomically via a tempfile."""
         try:
-            with open(self.settings_path, 'w') as f:
-                json.dump(self._data, f, indent=2)
+            tmp_path = f"{self.settings_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(orjson.dumps(self._data, option=orjson.OPT_INDENT_2))
+            os.replace(tmp_path, self.settings_path)
+            self.dirty = False
             logger.info("Settings saved successfully")
         except Exception as e:
             logger.error(f"Error saving settings: {str(e)}")
@@ -54,18 +66,148 @@ class Settings:
         """Get a top-level setting with a default value."""
         return self._data.get(key, default)
 
-def download_team_games(team_id):
-    """Download the Excel data for a team directly using the team ID"""
+    def google_sheets(self):
+        """Get the googleSheets settings subdict, creating it if missing."""
+        return self._data.setdefault('googleSheets', {})
+
+# HTTP statuses worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+async def download_team_games(session, semaphore, team_id, retries=3, backoff_factor=0.5):
+    """Download the Excel data for a team directly using the team ID.
+
+    Transient errors (429/5xx) are retried with exponential backoff before
+    giving up on the team.
+    """
     try:
         export_url = f"https://www.basketplan.ch/exportTeamGames.do?teamId={team_id}"
-        logger.info(f"Downloading Excel from: {export_url}")
-        response = requests.get(export_url)
-        response.raise_for_status()
-        return response.content
+        async with semaphore:
+            logger.info(f"Downloading Excel from: {export_url}")
+            for attempt in range(retries + 1):
+                async with session.get(export_url) as response:
+                    if response.status in RETRY_STATUS_CODES and attempt < retries:
+                        delay = backoff_factor * (2 ** attempt)
+                        logger.warning(
+                            f"Got HTTP {response.status} for team {team_id}, "
+                            f"retrying in {delay:.1f}s")
+                        await asyncio.sleep(delay)
+                        continue
+                    response.raise_for_status()
+                    # Stream the body into a buffer that can be handed straight
+                    # to pd.read_excel, instead of materialising an intermediate
+                    # bytes object per response
+                    buffer = io.BytesIO()
+                    async for chunk in response.content.iter_chunked(65536):
+                        buffer.write(chunk)
+                    buffer.seek(0)
+                    return buffer
     except Exception as e:
         logger.error(f"Error downloading Excel: {str(e)}")
         raise
 
+async def collect_team_games(teams, existing_sheet_titles):
+    """Download and parse the Excel data of all teams concurrently.
+
+    Returns a (games, changed_teams, new_hashes) triple: a dict mapping team
+    name to its parsed DataFrame, the set of teams whose download differs
+    from the content hash of the previous run, and the content hash of every
+    download. Nothing is written back to the settings here: the caller
+    commits a team's hash only once that team's sheet update succeeded.
+    When no team changed and every expected sheet already exists in the
+    spreadsheet (existing_sheet_titles), parsing is skipped entirely and the
+    games dict is empty; missing sheets force a full reprocess so a fresh or
+    manually edited spreadsheet gets repopulated even with unchanged data.
+    Teams whose download or parsing failed are logged and left out so the
+    caller can continue with the remaining teams.
+    """
+    # Limit concurrent requests so we don't hammer basketplan.ch
+    semaphore = asyncio.Semaphore(8)
+    tasks = {}
+    async with aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=16),
+            headers={'Accept-Encoding': 'gzip, deflate'}) as session:
+        async with asyncio.TaskGroup() as tg:
+            for team_name, team_data in teams.items():
+                team_id = team_data.get('id', '')
+                if not team_id:
+                    logger.warning(f"Skipping team {team_name}: No team ID provided")
+                    continue
+                tasks[team_name] = tg.create_task(
+                    _fetch_team_content(session, semaphore, team_name, team_id))
+
+        # Hash each download and compare against the hash persisted in
+        # settings.json, so unchanged teams can skip re-upload
+        buffers = {}
+        changed_teams = set()
+        new_hashes = {}
+        for team_name, task in tasks.items():
+            excel_buffer = task.result()
+            if excel_buffer is None:
+                continue
+            content_hash = hashlib.blake2b(excel_buffer.getvalue()).hexdigest()
+            new_hashes[team_name] = content_hash
+            if content_hash != teams[team_name].get('lastHash'):
+                changed_teams.add(team_name)
+            buffers[team_name] = excel_buffer
+
+        games = {}
+        if not changed_teams:
+            # Only short-circuit when the spreadsheet already holds every
+            # expected sheet; otherwise the data may be unchanged but the
+            # sheets themselves are missing (fresh spreadsheet, manual
+            # deletion) and must be rebuilt
+            expected_sheets = {team_name[:24] for team_name in buffers} | {"All"}
+            if expected_sheets <= existing_sheet_titles:
+                logger.info("No team data changed since last run, skipping parsing")
+                return games, changed_teams, new_hashes
+            logger.info("No team data changed but some sheets are missing, reprocessing")
+
+        # The combined "All" sheet needs every team, so once any team
+        # changed all downloads are parsed. Parsing runs in a thread pool:
+        # it is CPU-bound, calamine releases the GIL, and the worker threads
+        # keep the event loop responsive
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+            parse_tasks = {
+                team_name: loop.run_in_executor(executor, _read_team_excel, excel_buffer)
+                for team_name, excel_buffer in buffers.items()
+            }
+            for team_name, task in parse_tasks.items():
+                try:
+                    games[team_name] = await task
+                except Exception as e:
+                    logger.error(f"Error parsing Excel for team {team_name}: {str(e)}")
+                    continue
+        return games, changed_teams, new_hashes
+
+def _read_team_excel(excel_buffer):
+    """Parse a team's Excel buffer and shrink low-cardinality string columns.
+
+    Basketplan exports repeat team, venue and league names on every row;
+    converting string columns where less than half the values are unique to
+    category dtype cuts the memory held across teams and speeds up the
+    final concat and sort.
+    """
+    df = pd.read_excel(excel_buffer, engine='calamine')
+    for col in df.columns:
+        # pandas >= 3 reads text as 'str' dtype instead of object, so test
+        # each column's dtype rather than selecting object columns
+        if not pd.api.types.is_string_dtype(df[col]):
+            continue
+        non_null = df[col].dropna()
+        if (len(non_null) and isinstance(non_null.iloc[0], str)
+                and non_null.nunique() / max(len(df), 1) < 0.5):
+            df[col] = df[col].astype('category')
+    return df
+
+async def _fetch_team_content(session, semaphore, team_name, team_id):
+    """Fetch one team's Excel content, returning None on failure."""
+    try:
+        return await download_team_games(session, semaphore, team_id)
+    except Exception as e:
+        logger.error(f"Error downloading games for team {team_name}: {str(e)}")
+        return None
+
 def get_google_services(credentials_path='credentials.json'):
     """Authenticate and get Google Sheets and Drive services"""
     try:
@@ -84,8 +226,9 @@ def get_spreadsheet_id(drive_service, sheets_service, settings : Settings):
     """Get spreadsheet ID from settings, verify it exists, or create a new one"""
     try:
         # Load settings
-        spreadsheet_id = settings.get('googleSheets', {}).get('spreadsheetId', '')
-        spreadsheet_name = settings.get('googleSheets', {}).get('spreadsheetName', 'BasketPlan Games')
+        google_sheets = settings.google_sheets()
+        spreadsheet_id = google_sheets.get('spreadsheetId', '')
+        spreadsheet_name = google_sheets.get('spreadsheetName', 'BasketPlan Games')
         
         # Step 1: Check if spreadsheet ID exists in settings and is valid
         if spreadsheet_id:
@@ -111,11 +254,9 @@ def get_spreadsheet_id(drive_service, sheets_service, settings : Settings):
             logger.info(f"Found existing spreadsheet by name: {spreadsheet_name}, ID: {spreadsheet_id}")
             
             # Update settings with the found ID and name
-            if not settings.get('googleSheets'):
-                settings._data['googleSheets'] = {}
-            settings._data['googleSheets']['spreadsheetId'] = spreadsheet_id
-            settings._data['googleSheets']['spreadsheetName'] = spreadsheet_name
-            settings.save_settings()
+            google_sheets['spreadsheetId'] = spreadsheet_id
+            google_sheets['spreadsheetName'] = spreadsheet_name
+            settings.dirty = True
             
             return spreadsheet_id
         
@@ -131,95 +272,144 @@ def get_spreadsheet_id(drive_service, sheets_service, settings : Settings):
         spreadsheet_id = spreadsheet['spreadsheetId']
         
         # Update settings with the new ID and name
-        if not settings.get('googleSheets'):
-            settings._data['googleSheets'] = {}
-        settings._data['googleSheets']['spreadsheetId'] = spreadsheet_id
-        settings._data['googleSheets']['spreadsheetName'] = spreadsheet_name
-        settings.save_settings()
+        google_sheets['spreadsheetId'] = spreadsheet_id
+        google_sheets['spreadsheetName'] = spreadsheet_name
+        settings.dirty = True
         
         return spreadsheet_id
     except Exception as e:
         logger.error(f"Error getting or creating spreadsheet: {str(e)}")
         raise
 
-def share_spreadsheet(drive_service, spreadsheet_id, email):
-    """Share the spreadsheet with users in settings.json"""
+def share_spreadsheet(drive_service, spreadsheet_id, emails):
+    """Share the spreadsheet with users in settings.json using one batch request"""
+    if not emails:
+        return
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            logger.error(f"Error sharing spreadsheet with {request_id}: {str(exception)}")
+        else:
+            logger.info(f"Shared spreadsheet with {request_id}")
+
     try:
-        user_permission = {
-            'type': 'user',
-            'role': 'writer',
-            'emailAddress': email
-        }
-        
-        drive_service.permissions().create(
-            fileId=spreadsheet_id,
-            body=user_permission,
-            fields='id',
-            sendNotificationEmail=False
-        ).execute()
-        
-        logger.info(f"Shared spreadsheet with {email}")
+        # Send all permission creates in a single multipart batch request
+        batch = drive_service.new_batch_http_request(callback=callback)
+        for email in emails:
+            user_permission = {
+                'type': 'user',
+                'role': 'writer',
+                'emailAddress': email
+            }
+            batch.add(drive_service.permissions().create(
+                fileId=spreadsheet_id,
+                body=user_permission,
+                fields='id',
+                sendNotificationEmail=False
+            ), request_id=email)
+        batch.execute()
     except Exception as e:
-        logger.error(f"Error sharing spreadsheet with {email}: {str(e)}")
-        # Continue with next user even if sharing with one fails
+        logger.error(f"Error sharing spreadsheet: {str(e)}")
+        # Continue the run even if sharing fails
 
-def update_sheet(sheets_service, spreadsheet_id, sheet_name, df):
-    """Update a sheet with dataframe content while preserving column order"""
+def get_sheet_metadata(sheets_service, spreadsheet_id):
+    """Fetch the sheet ids and header rows of all sheets once per run.
+
+    Returns a (sheet_ids, sheet_headers) pair of dicts keyed by sheet title,
+    so sheet updates don't need any per-sheet metadata round trips.
+    """
     try:
-        # Check if sheet exists, if not create it
-        try:
-            sheets_service.spreadsheets().get(
+        metadata = sheets_service.spreadsheets().get(
+            spreadsheetId=spreadsheet_id,
+            fields='sheets.properties'
+        ).execute()
+        sheet_ids = {sheet['properties']['title']: sheet['properties']['sheetId']
+                     for sheet in metadata.get('sheets', [])}
+
+        # Read the header row of every sheet in a single batchGet
+        sheet_headers = {}
+        if sheet_ids:
+            result = sheets_service.spreadsheets().values().batchGet(
                 spreadsheetId=spreadsheet_id,
-                ranges=f"{sheet_name}!A1"
+                ranges=[f"{title}!A1:Z1" for title in sheet_ids]
             ).execute()
-        except HttpError as e:
-            if e.resp.status == 400 or e.resp.status == 404:
-                # Add new sheet
-                request_body = {
-                    'requests': [{
-                        'addSheet': {
-                            'properties': {
-                                'title': sheet_name
-                            }
-                        }
-                    }]
-                }
-                sheets_service.spreadsheets().batchUpdate(
-                    spreadsheetId=spreadsheet_id,
-                    body=request_body
-                ).execute()
-                logger.info(f"Created new sheet: {sheet_name}")
-            else:
-                raise
-        
-        # Replace NaN with empty string
-        df = df.replace({np.nan: ''})
-        
-        # Convert timestamp columns to strings
-        for col in df.select_dtypes(include=['datetime64', 'datetime64[ns]']).columns:
-            df[col] = df[col].dt.strftime('%Y-%m-%d')
-            
-        # Convert time columns to strings
-        for col in df.select_dtypes(include=['timedelta64[ns]']).columns:
-            df[col] = df[col].astype(str)
-        
-        # Handle any remaining datetime.time objects
-        for col in df.columns:
-            if df[col].apply(lambda x: isinstance(x, datetime.time)).any():
-                df[col] = df[col].apply(lambda x: x.strftime('%H:%M') if isinstance(x, datetime.time) else x)
-        
+            for title, value_range in zip(sheet_ids, result.get('valueRanges', [])):
+                values = value_range.get('values', [])
+                sheet_headers[title] = values[0] if values else []
+
+        return sheet_ids, sheet_headers
+    except Exception as e:
+        logger.error(f"Error fetching sheet metadata: {str(e)}")
+        raise
+
+def cell_data(value):
+    """Convert a Python value to a Sheets API CellData dict"""
+    if isinstance(value, bool):
+        return {'userEnteredValue': {'boolValue': value}}
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return {'userEnteredValue': {'numberValue': float(value)}}
+    return {'userEnteredValue': {'stringValue': str(value)}}
+
+def format_df_for_sheets(df):
+    """Convert a dataframe's values to the strings Sheets expects.
+
+    Returns a new dataframe and leaves the caller's typed frame untouched,
+    so the raw frames can still be concatenated and sorted on real dtypes.
+    """
+    df = df.copy()
+
+    # Materialise category columns back to plain values for export
+    for col in df.select_dtypes(include='category').columns:
+        df[col] = df[col].astype(object)
+
+    # Convert timestamp columns to strings with pyarrow's native strftime kernel
+    for col in df.select_dtypes(include=['datetime64', 'datetime64[ns]']).columns:
+        arr = pa.Array.from_pandas(df[col])
+        df[col] = pc.strftime(arr, format='%Y-%m-%d').to_pandas().to_numpy()
+
+    # Convert time columns to strings
+    for col in df.select_dtypes(include=['timedelta64[ns]']).columns:
+        df[col] = df[col].astype(str)
+
+    # Handle any remaining datetime.time objects (only object columns can hold them)
+    for col in df.select_dtypes(include='object').columns:
+        mask = df[col].map(lambda x: isinstance(x, datetime.time))
+        if mask.any():
+            arr = pa.array(df.loc[mask, col].tolist())
+            df.loc[mask, col] = pc.strftime(arr, format='%H:%M').to_pandas().to_numpy()
+
+    # Replace missing values with empty strings, column by column: object
+    # columns take the vectorized fill directly, while typed columns still
+    # holding NA (floats with NaN, nullable ints like Week) are cast to
+    # object first, both because '' is not a valid fill value for them and
+    # because a bare NaN would serialize as invalid JSON in the API payload
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].fillna('')
+        elif df[col].isna().any():
+            df[col] = df[col].astype(object).fillna('')
+
+    return df
+
+def build_sheet_requests(sheet_name, df, sheet_ids, sheet_headers):
+    """Build the batchUpdate requests to replace a sheet's content with a dataframe,
+    preserving column order.
+
+    Nothing is executed here: the returned request dicts are accumulated by the
+    caller so all sheets can be updated with a single batchUpdate call.
+    """
+    try:
+        requests = []
+        sheet_exists = sheet_name in sheet_ids
+
+        # Format values for Sheets without touching the caller's typed frame
+        df = format_df_for_sheets(df)
+
         # Check if we need to reorder columns
-        # Get existing columns from the sheet
-        existing_columns = []
-        sheet_header = sheets_service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id,
-            range=f"{sheet_name}!A1:Z1"
-        ).execute()
-            
-        # Get current columns from the sheet
-        if 'values' in sheet_header and sheet_header['values']:
-            existing_columns = sheet_header['values'][0]
-                
+        # Get existing columns from the cached header rows
+        existing_columns = sheet_headers.get(sheet_name, [])
+
+
         if existing_columns:
             # Get common columns that exist in both the existing sheet and the DataFrame
             common_columns = [col for col in existing_columns if col in df.columns]
@@ -232,29 +422,73 @@ def update_sheet(sheets_service, spreadsheet_id, sheet_name, df):
                 df = df[common_columns + new_columns]
                 logger.info(f"Reordered columns to match existing sheet.")
         
-        # Convert to values list
-        values = [df.columns.tolist()] + df.values.tolist()
-                
-        # Clear existing content
-        sheets_service.spreadsheets().values().clear(
-            spreadsheetId=spreadsheet_id,
-            range=f"{sheet_name}!A1:Z50000"
-        ).execute()
-        
-        # Update sheet with data
-        result = sheets_service.spreadsheets().values().update(
-            spreadsheetId=spreadsheet_id, 
-            range=f"{sheet_name}!A1", 
-            valueInputOption='RAW',
-            body={'values': values}
-        ).execute()
-        
-        logger.info(f"Updated sheet: {sheet_name} with {result.get('updatedCells')} cells")
+        # Convert to values list in one C-level pass instead of per-row tolist
+        header = df.columns.to_numpy(dtype=object).tolist()
+        body = df.to_numpy(dtype=object, copy=False).tolist()
+        values = [header, *body]
+
+        if sheet_exists:
+            sheet_id = sheet_ids[sheet_name]
+
+            # Resize the grid to fit the data first: unlike values().update,
+            # updateCells does not auto-expand the grid, and a write past the
+            # grid limits would reject the whole atomic batch
+            requests.append({
+                'updateSheetProperties': {
+                    'properties': {
+                        'sheetId': sheet_id,
+                        'gridProperties': {
+                            'rowCount': max(1000, len(values)),
+                            'columnCount': max(26, len(df.columns))
+                        }
+                    },
+                    'fields': 'gridProperties.rowCount,gridProperties.columnCount'
+                }
+            })
+
+            # Queue a clear of the existing content; running it in the same
+            # batch as the data write avoids a transient empty sheet
+            requests.append({
+                'updateCells': {
+                    'range': {'sheetId': sheet_id},
+                    'fields': 'userEnteredValue'
+                }
+            })
+        else:
+            # Queue creation of the new sheet, sized to fit the data
+            sheet_id = max(sheet_ids.values(), default=0) + 1
+            sheet_ids[sheet_name] = sheet_id
+            requests.append({
+                'addSheet': {
+                    'properties': {
+                        'title': sheet_name,
+                        'sheetId': sheet_id,
+                        'gridProperties': {
+                            'rowCount': max(1000, len(values)),
+                            'columnCount': max(26, len(df.columns))
+                        }
+                    }
+                }
+            })
+            logger.info(f"Queued creation of new sheet: {sheet_name}")
+
+        # Queue the cell update with the new data
+        requests.append({
+            'updateCells': {
+                'start': {'sheetId': sheet_id, 'rowIndex': 0, 'columnIndex': 0},
+                'rows': [{'values': [cell_data(value) for value in row]} for row in values],
+                'fields': 'userEnteredValue'
+            }
+        })
+
+        logger.info(f"Queued update of sheet: {sheet_name} with {len(values) * len(df.columns)} cells")
+        return requests
     except Exception as e:
-        logger.error(f"Error updating sheet {sheet_name}: {str(e)}")
+        logger.error(f"Error building update for sheet {sheet_name}: {str(e)}")
         raise
 
 def main():
+    settings = None
     try:
         # Load settings
         settings = Settings()
@@ -272,45 +506,52 @@ def main():
         spreadsheet_id = get_spreadsheet_id(drive_service, sheets_service, settings)
         
         # Share spreadsheet with users from settings
-        users = settings.get('googleSheets', {}).get('writePrivilege', [])
-        for email in users:
-            share_spreadsheet(drive_service, spreadsheet_id, email)
+        users = settings.google_sheets().get('writePrivilege', [])
+        share_spreadsheet(drive_service, spreadsheet_id, users)
         
+        # Fetch sheet metadata once so all updates can go into one batchUpdate
+        sheet_ids, sheet_headers = get_sheet_metadata(sheets_service, spreadsheet_id)
+
         # Create a list to hold all dataframes for the combined sheet
         all_games = []
-        
+
+        # Accumulate the batchUpdate requests for all sheets, and track which
+        # teams those requests cover so their hashes can be committed later
+        all_requests = []
+        uploaded_teams = set()
+
+        # Download and parse all team games concurrently
+        games, changed_teams, new_hashes = asyncio.run(
+            collect_team_games(teams, set(sheet_ids)))
+
         # Process each team
-        for team_name, team_data in teams.items():
+        for team_name, df in games.items():
             logger.info(f"Processing team: {team_name}")
-            
+
             try:
-                # Check if team ID is valid
-                team_id = team_data.get('id', '')
-                if not team_id:
-                    logger.warning(f"Skipping team {team_name}: No team ID provided")
-                    continue
-                
-                # Download Excel content directly
-                excel_content = download_team_games(team_id)
-                
-                # Read the Excel data
-                df = pd.read_excel(io.BytesIO(excel_content))
-                
                 # Add a column to identify the team
                 df['Team'] = team_name
                 
                 # Add the week number
                 if 'Datum' in df.columns:
-                    df['Week'] = df['Datum'].dt.isocalendar().week
+                    # calamine can return dates as strings depending on cell formatting
+                    if not pd.api.types.is_datetime64_any_dtype(df['Datum']):
+                        df['Datum'] = pd.to_datetime(df['Datum'], format='%d.%m.%Y', cache=True)
+                    df['Week'] = df['Datum'].dt.isocalendar()['week'].astype('UInt8')
                 
                 # Append to the list of all games
                 all_games.append(df)
                 
-                # Update sheet for this team
+                # Queue the sheet update for this team, unless its data is
+                # unchanged and its sheet already exists
                 sheet_name = team_name[:24]  # Sheet names limited to 24 chars in Google Sheets
-                update_sheet(sheets_service, spreadsheet_id, sheet_name, df)
-                
-                logger.info(f"Added sheet for team {team_name}")
+                if team_name in changed_teams or sheet_name not in sheet_ids:
+                    all_requests.extend(build_sheet_requests(
+                        sheet_name, df, sheet_ids, sheet_headers))
+                    uploaded_teams.add(team_name)
+                    logger.info(f"Queued sheet for team {team_name}")
+                else:
+                    logger.info(f"Skipping sheet for team {team_name}: data unchanged")
             except Exception as e:
                 logger.error(f"Error processing team {team_name}: {str(e)}")
                 continue
@@ -318,16 +559,34 @@ def main():
         # Create combined "All" sheet with all games
         if all_games:
             logger.info("Creating combined 'All' sheet with all games")
-            combined_df = pd.concat(all_games, ignore_index=True)
-            
+            combined_df = pd.concat(all_games, ignore_index=True, copy=False)
+
             if "Datum" in combined_df.columns:
-                # Sort by date
-                combined_df = combined_df.sort_values(by="Datum")
+                # Stable sort on the still-typed datetime column, so games on
+                # the same date keep their per-team order
+                combined_df = combined_df.sort_values(by="Datum", kind='mergesort')
             
-            # Update "All" sheet
-            update_sheet(sheets_service, spreadsheet_id, "All", combined_df)
-            logger.info(f"Added combined 'All' sheet with {len(combined_df)} games")
-        
+            # Queue the "All" sheet update
+            all_requests.extend(build_sheet_requests(
+                "All", combined_df, sheet_ids, sheet_headers))
+            logger.info(f"Queued combined 'All' sheet with {len(combined_df)} games")
+
+        # Apply all queued sheet updates in a single batchUpdate call
+        if all_requests:
+            sheets_service.spreadsheets().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={'requests': all_requests}
+            ).execute()
+            logger.info(f"Applied {len(all_requests)} sheet updates in one batchUpdate")
+
+            # Commit the new content hashes only for teams whose sheet update
+            # made it into the successful batch; teams whose parse or
+            # processing failed keep their old hash and are retried next run
+            for team_name in uploaded_teams:
+                if teams[team_name].get('lastHash') != new_hashes[team_name]:
+                    teams[team_name]['lastHash'] = new_hashes[team_name]
+                    settings.dirty = True
+
         spreadsheet_url = f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}"
         logger.info(f"Google Sheet updated: {spreadsheet_url}")
         print(f"Google Sheet updated: {spreadsheet_url}")
@@ -335,6 +594,10 @@ def main():
     except Exception as e:
         logger.error(f"Script execution failed: {str(e)}")
         print(f"Error: {str(e)}")
+    finally:
+        # Write all accumulated settings mutations in a single pass
+        if settings is not None and settings.dirty:
+            settings.save_settings()
 
 if __name__ == "__main__":
     main()